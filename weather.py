@@ -1,9 +1,15 @@
 import streamlit as st
+import orjson
 import requests
+import requests_cache
+from requests.adapters import HTTPAdapter
+import numpy as np
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 from datetime import datetime
-from pytz import timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
 
 # Set the page layout to 'wide' for better use of horizontal space
 st.set_page_config(
@@ -26,70 +32,253 @@ CITIES = {
     "Austin": {"latitude": 30.2672, "longitude": -97.7431},
 }
 
+# How long fetched forecasts are reused before hitting the API again
+CACHE_TTL = 1800 # seconds
+
+REQUEST_TIMEOUT = 5 # seconds
+
+# Shared HTTP session so the connection to the API is kept alive and reused across reruns.
+# Responses are also cached on disk so a server restart doesn't cold-start the API calls.
+@st.cache_resource
+def get_session():
+    """Returns the process-wide pooled, disk-cached HTTP session."""
+    session = requests_cache.CachedSession("openmeteo_cache", expire_after=CACHE_TTL)
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=10))
+    return session
+
 # --- Function to fetch data from API ---
-@st.cache_data
-def get_weather_data(latitude, longitude):
-    """Fetches hourly temperature data from Open-Meteo API in Fahrenheit."""
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_all_weather():
+    """Fetches hourly temperature data for every city from Open-Meteo API in Fahrenheit, in one request.
+
+    Errors are raised rather than returned so that a failed request is not cached
+    and the next rerun retries it.
+    """
     url = "https://api.open-meteo.com/v1/forecast"
     params = {
-        "latitude": latitude,
-        "longitude": longitude,
+        "latitude": ",".join(str(city["latitude"]) for city in CITIES.values()),
+        "longitude": ",".join(str(city["longitude"]) for city in CITIES.values()),
         "hourly": "temperature_2m",
         "temperature_unit": "fahrenheit",
-        "timezone": "auto"
+        "timezone": "auto",
+        # Only request the window the trend chart shows: yesterday plus three days ahead
+        "past_days": 1,
+        "forecast_days": 3
     }
+    response = get_session().get(url, params=params, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+    # A multi-location request returns one result per location, in request order
+    if isinstance(data, dict):
+        data = [data]
+    return dict(zip(CITIES, data))
+
+# --- Timezone lookup, memoized so each zone is loaded once per process ---
+@lru_cache(maxsize=32)
+def get_timezone(name):
+    """Returns the tzinfo object for an IANA timezone name."""
+    return ZoneInfo(name)
+
+# --- Downsample long series before handing them to Plotly ---
+MAX_TREND_POINTS = 1000
+
+def lttb_indices(x, y, n_out):
+    """Returns the indices of the points kept by Largest-Triangle-Three-Buckets downsampling."""
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # First and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[prev] - avg_x) * (y[start:end] - y[prev])
+            - (x[prev] - x[start:end]) * (avg_y - y[prev])
+        )
+        prev = start + int(np.argmax(areas))
+        indices[i + 1] = prev
+    return indices
+
+# --- Typed table of cities, indexed by name for direct city -> coordinates lookup ---
+# Streamlit re-executes this script on every interaction, so the table is held in the
+# resource cache rather than rebuilt at module scope each run. It is never mutated.
+@st.cache_resource
+def build_cities_df():
+    """Builds the static table of city coordinates, indexed by a categorical city name."""
+    return pd.DataFrame({
+        "City": pd.Categorical(list(CITIES)),
+        "latitude": np.fromiter((c["latitude"] for c in CITIES.values()), dtype=np.float64),
+        "longitude": np.fromiter((c["longitude"] for c in CITIES.values()), dtype=np.float64),
+    }).set_index("City")
+
+CITIES_DF = build_cities_df()
+
+# --- City map: the base figure is built once, then only the marker arrays differ per city ---
+@st.cache_resource
+def base_map():
+    """Builds the map of all cities without any highlighting."""
+    fig = px.scatter_mapbox(
+        CITIES_DF.reset_index(),
+        lat="latitude",
+        lon="longitude",
+        hover_name="City",
+        hover_data={"latitude": True, "longitude": True},
+        zoom=3,
+        mapbox_style="carto-positron",
+        center={"lat": 39.8283, "lon": -98.5795}
+    )
+    fig.update_layout(
+        height=400,
+        margin={"r":0,"t":0,"l":0,"b":0},
+        showlegend=False
+    )
+    return fig
+
+@st.cache_resource
+def city_map(city_name):
+    """Returns a copy of the base map with only the selected city's marker patched."""
+    # Cached figures are shared across sessions, so patch a copy and never mutate it afterwards
+    fig = go.Figure(base_map())
+    mask = CITIES_DF.index == city_name
+    fig.data[0].marker.size = np.where(mask, 20, 10)
+    # Same area scaling px applied for size="size" (size_max=20): 20 -> 20px, 10 -> ~14px
+    fig.data[0].marker.sizemode = "area"
+    fig.data[0].marker.sizeref = 0.05
+    fig.data[0].marker.color = np.where(mask, "green", "blue") # Selected city is green
+    return fig
+
+# --- Weather panel, rendered as a fragment so it can rerun independently of the map ---
+@st.fragment
+def render_weather(city_name):
+    """Renders the key metrics and hourly temperature trend for a city."""
+    city = CITIES_DF.loc[city_name]
+    st.subheader(f"Weather for: {city_name}")
+    st.write(f"**Coordinates:** Latitude {city['latitude']}, Longitude {city['longitude']}")
+
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        return data
-    except requests.exceptions.RequestException as e:
+        with st.spinner("Fetching weather data..."):
+            weather_data = get_all_weather().get(city_name)
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         st.error(f"Error fetching data: {e}")
-        return None
+        weather_data = None
+
+    if not (weather_data and "hourly" in weather_data):
+        st.warning("Weather data is not available for this city.")
+        return
+
+    # Build the DataFrame, metrics and trend figure in one pass, then render both sections
+    hourly_data = weather_data["hourly"]
+    # Declare dtypes up front; missing readings (null) become NaN in the float32 array.
+    # Open-Meteo returns local wall-clock times; an explicit format skips per-element inference
+    times = pd.Series(pd.to_datetime(hourly_data["time"], format="%Y-%m-%dT%H:%M", cache=True))
+    df = pd.DataFrame({
+        "time": times,
+        "temperature_2m": np.asarray(hourly_data["temperature_2m"], dtype=np.float32)
+    })
+
+    api_timezone_str = weather_data.get("timezone", "UTC")
+    try:
+        tz = get_timezone(api_timezone_str)
+        df["time"] = times.dt.tz_localize(tz, ambiguous="NaT", nonexistent="shift_forward")
+        current_time = datetime.now(tz)
+    except Exception:
+        st.warning("Could not localize timezone, using UTC as a fallback.")
+        df["time"] = times.dt.tz_localize('UTC')
+        current_time = datetime.now(get_timezone('UTC'))
 
-# Convert cities dictionary to a DataFrame for plotting
-cities_df = pd.DataFrame.from_dict(CITIES, orient='index').reset_index()
-cities_df.rename(columns={'index': 'City'}, inplace=True)
+    # Compare against the underlying UTC datetime64 values in a single vectorized pass;
+    # this mask drives both the metrics and the historical/forecast marker colors
+    current_time_np = pd.Timestamp(current_time).to_datetime64()
+    is_hist = df["time"].values <= current_time_np
+
+    # Reuse the mask on the raw array instead of re-filtering the DataFrame
+    temps = df["temperature_2m"].to_numpy()
+    current_temp = temps[is_hist][-1] if is_hist.any() else temps[0]
+    max_temp = np.nanmax(temps)
+    min_temp = np.nanmin(temps)
+
+    # Convert datetime to a millisecond timestamp for Plotly
+    current_time_ms = int(current_time.timestamp() * 1000)
+
+    # Cap the number of points sent to the browser regardless of the forecast horizon
+    plot_idx = lttb_indices(df["time"].values.astype(np.int64), temps, MAX_TREND_POINTS)
+    plot_df = df.iloc[plot_idx]
+
+    # One WebGL trace for all points; historical/forecast is encoded per marker instead of per trace
+    fig = go.Figure(go.Scattergl(
+        x=plot_df["time"],
+        y=plot_df["temperature_2m"],
+        mode="lines+markers",
+        line=dict(color="lightgray"),
+        marker=dict(
+            size=4,
+            color=np.where(is_hist[plot_idx], "blue", "red")
+        ),
+        name="Temperature",
+        showlegend=False
+    ))
+    # Legend-only entries as a key for the marker colors; they carry no data
+    for label, color in (("Historical", "blue"), ("Forecast", "red")):
+        fig.add_trace(go.Scattergl(
+            x=[None],
+            y=[None],
+            mode="markers",
+            marker_color=color,
+            name=label,
+            hoverinfo="skip"
+        ))
+    fig.update_layout(
+        title="Hourly Temperature Over Time (Historical vs. Forecast)",
+        xaxis_title="time",
+        yaxis_title="Temperature (°F)"
+    )
+
+    # Pass the millisecond timestamp to fig.add_vline
+    fig.add_vline(x=current_time_ms, line_width=1, line_dash="dash", line_color="green", annotation_text="Current Time", annotation_position="top right")
+
+    # Adjust height of the trend chart to fit on one page
+    fig.update_layout(height=300, hovermode="x unified") # Reduced height slightly more
+    # Unified hover turns on x-axis spikes, whose data search is unbounded by default (-1);
+    # bound it to the hover distance. 0 would skip the search and drop the spike line entirely.
+    fig.update_layout(spikedistance=20)
+
+    st.header("Key Metrics")
+    metric1, metric2, metric3 = st.columns(3) # Metrics within the right column
+    with metric1:
+        st.metric("Current Temp", f"{current_temp:.1f}°F")
+    with metric2:
+        st.metric("Max Temp (Forecast)", f"{max_temp:.1f}°F")
+    with metric3:
+        st.metric("Min Temp (Forecast)", f"{min_temp:.1f}°F")
+
+    st.header("Hourly Temperature Trend")
+    st.plotly_chart(
+        fig,
+        use_container_width=True,
+        config={"scrollZoom": False} # Keep wheel zoom off explicitly; the page scrolls instead
+    )
 
 # --- Main Streamlit App UI ---
 st.title("US City Weather Dashboard 🗺️")
 st.markdown("Select a city from the dropdown below to see its hourly temperature trend and location on the map.")
 
-# Initialize session state flags
-if 'selected_city_name' not in st.session_state:
-    st.session_state.selected_city_name = list(CITIES.keys())[0]  # Default city
-if 'data_fetched' not in st.session_state:
-    st.session_state.data_fetched = False
-
-# Create the dropdown menu for city selection
-selected_city_from_dropdown = st.selectbox(
+# Create the dropdown menu for city selection; the widget keeps its own state across reruns
+selected_city_name = st.selectbox(
     "Select a city:",
     options=list(CITIES.keys()),
-    index=list(CITIES.keys()).index(st.session_state.selected_city_name),
+    index=0, # Default city
     key="city_select_box"
 )
 
-# Update session state based on dropdown selection
-if st.session_state.selected_city_name != selected_city_from_dropdown:
-    st.session_state.selected_city_name = selected_city_from_dropdown
-    selected_city = CITIES[selected_city_from_dropdown]
-    st.session_state.latitude = selected_city["latitude"]
-    st.session_state.longitude = selected_city["longitude"]
-    st.session_state.data_fetched = True
-    st.rerun()
-
-# Get coordinates for the currently selected city (from dropdown)
-if st.session_state.data_fetched:
-    latitude = st.session_state.latitude
-    longitude = st.session_state.longitude
-    selected_city_name = st.session_state.selected_city_name
-else:
-    # Use default city if no interaction has happened yet
-    selected_city_name = st.session_state.selected_city_name
-    selected_city = CITIES[selected_city_name]
-    latitude = selected_city["latitude"]
-    longitude = selected_city["longitude"]
-
 # --- Main Layout: Two columns for Map (left) and Weather Data (right) ---
 main_col1, main_col2 = st.columns([0.5, 0.5]) # Left half for map, Right half for weather data
 
@@ -97,94 +286,9 @@ with main_col1: # Left column for the map
     st.subheader("Interactive City Map")
 
     # Highlight the selected city with a different color and larger marker
-    cities_df['size'] = [10] * len(cities_df)
-    cities_df['color'] = [False] * len(cities_df)
-    selected_city_index = cities_df[cities_df['City'] == selected_city_name].index[0]
-    cities_df.loc[selected_city_index, 'size'] = 20
-    cities_df.loc[selected_city_index, 'color'] = True
-
-    fig_map = px.scatter_mapbox(
-        cities_df,
-        lat="latitude",
-        lon="longitude",
-        hover_name="City",
-        hover_data={"latitude": True, "longitude": True, "size": False, "color": False},
-        color="color",
-        color_discrete_map={True: "green", False: "blue"}, # Selected city is green
-        size="size",
-        zoom=3,
-        mapbox_style="carto-positron",
-        center={"lat": 39.8283, "lon": -98.5795}
-    )
-    fig_map.update_layout(
-        height=400,
-        margin={"r":0,"t":0,"l":0,"b":0},
-        showlegend=False # Hide the True/False legend
-    )
+    fig_map = city_map(selected_city_name)
 
     st.plotly_chart(fig_map, use_container_width=True) # use_container_width here means 100% of main_col1
 
 with main_col2: # Right column for weather data
-    st.subheader(f"Weather for: {selected_city_name}")
-    st.write(f"**Coordinates:** Latitude {latitude}, Longitude {longitude}")
-
-    st.header("Key Metrics")
-    with st.spinner("Fetching weather data..."):
-        weather_data = get_weather_data(latitude, longitude)
-
-    if weather_data and "hourly" in weather_data:
-        hourly_data = weather_data["hourly"]
-        df = pd.DataFrame(hourly_data)
-        df["temperature_2m"] = pd.to_numeric(df["temperature_2m"], errors='coerce')
-        
-        api_timezone_str = weather_data.get("timezone", "UTC") 
-        try:
-            tz = timezone(api_timezone_str)
-            df["time"] = pd.to_datetime(df["time"]).dt.tz_localize(tz)
-            current_time = datetime.now(tz)
-        except Exception:
-            st.warning("Could not localize timezone, using UTC as a fallback.")
-            df["time"] = pd.to_datetime(df["time"]).dt.tz_localize('UTC')
-            current_time = datetime.now(timezone('UTC'))
-
-        df["Type"] = df["time"].apply(lambda x: "Forecast" if x > current_time else "Historical")
-
-        current_temp_row = df[df["Type"] == "Historical"].iloc[-1] if not df[df["Type"] == "Historical"].empty else df.iloc[0]
-        current_temp = current_temp_row["temperature_2m"]
-        max_temp = df["temperature_2m"].max()
-        min_temp = df["temperature_2m"].min()
-        
-        metric1, metric2, metric3 = st.columns(3) # Metrics within the right column
-        with metric1:
-            st.metric("Current Temp", f"{current_temp}°F")
-        with metric2:
-            st.metric("Max Temp (Forecast)", f"{max_temp}°F")
-        with metric3:
-            st.metric("Min Temp (Forecast)", f"{min_temp}°F")
-    else:
-        st.warning("Weather data is not available for this city.")
-        
-    st.header("Hourly Temperature Trend")
-    if weather_data and "hourly" in weather_data:
-        # Convert datetime to a millisecond timestamp for Plotly
-        current_time_ms = int(current_time.timestamp() * 1000)
-
-        fig = px.line(df, 
-                      x="time", 
-                      y="temperature_2m",
-                      color="Type",
-                      color_discrete_map={
-                          "Historical": "blue",
-                          "Forecast": "red"
-                      },
-                      labels={"temperature_2m": "Temperature (°F)"},
-                      title="Hourly Temperature Over Time (Historical vs. Forecast)")
-        
-        # Pass the millisecond timestamp to fig.add_vline
-        fig.add_vline(x=current_time_ms, line_width=1, line_dash="dash", line_color="green", annotation_text="Current Time", annotation_position="top right")
-        
-        # Adjust height of the trend chart to fit on one page
-        fig.update_layout(height=300) # Reduced height slightly more
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.info("Select a city to see the temperature trend.")
\ No newline at end of file
+    render_weather(selected_city_name)
\ No newline at end of file